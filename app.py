@@ -1,13 +1,22 @@
 import hashlib
+import hmac
+import json
 import logging
 import os
 import random
-import time
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from functools import wraps
-from typing import List, Dict, Optional
+from functools import lru_cache, wraps
+from itertools import chain
+from typing import Any, Callable, List, Dict, Optional, Tuple
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 import streamlit as st
+from postgrest.exceptions import APIError
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from supabase import create_client, Client
 from supabase.lib.client_options import ClientOptions
 
@@ -24,19 +33,44 @@ logger = logging.getLogger(__name__)
 class Config:
     SUPABASE_URL = os.getenv('SUPABASE_URL', st.secrets["SUPABASE_URL"])
     SUPABASE_KEY = os.getenv('SUPABASE_KEY', st.secrets["SUPABASE_KEY"])
-    ADMIN_PASSWORD_HASH = hashlib.sha256(st.secrets["ADMIN_PASSWORD"].encode()).hexdigest()
     TENCENT_DOC_URL = st.secrets.get("TENCENT_DOC_URL", "")
-    GAME_CLASSES = ['大理', '峨眉', '丐帮', '明教', '天山', '无尘', '武当', '逍遥', '星宿', '玄机', '白驼山']
+    GAME_CLASSES_ORDERED = ('大理', '峨眉', '丐帮', '明教', '天山', '无尘', '武当', '逍遥', '星宿', '玄机', '白驼山')  # 界面下拉顺序
+    GAME_CLASS_INDEX = {c: i for i, c in enumerate(GAME_CLASSES_ORDERED)}  # 职业→下拉位置，兼作成员判断
     MAX_TEAM_SIZE = 6
     MIN_TEAM_SIZE = 2
 
 
-# 初始化Supabase客户端
-supabase: Client = create_client(
-    Config.SUPABASE_URL,
-    Config.SUPABASE_KEY,
-    options=ClientOptions(postgrest_client_timeout=10)
-)
+# players 表结构（直接按列构建DataFrame，跳过逐行类型推断；空表时也保留列）
+PLAYERS_SCHEMA = pa.schema([
+    ('display_id', pa.int64()),
+    ('game_id', pa.string()),
+    ('class', pa.string()),
+    ('is_selected', pa.bool_()),
+])
+
+# 玩家表展示用列名
+PLAYER_COLUMN_LABELS = {
+    'display_id': '序号',
+    'game_id': '游戏ID',
+    'class': '游戏职业',
+    'is_selected': '已选择'
+}
+
+
+@st.cache_resource
+def get_admin_password_hash() -> bytes:
+    """管理员密码的SHA-256摘要（进程内只读取密钥并计算一次）"""
+    return hashlib.sha256(st.secrets["ADMIN_PASSWORD"].encode()).digest()
+
+
+# 初始化Supabase客户端（进程级单例，所有会话共享同一连接池）
+@st.cache_resource
+def get_supabase() -> Client:
+    return create_client(
+        Config.SUPABASE_URL,
+        Config.SUPABASE_KEY,
+        options=ClientOptions(postgrest_client_timeout=10)
+    )
 
 
 # ========================
@@ -55,6 +89,50 @@ def handle_db_errors(func):
     return wrapper
 
 
+def invalidates_cache(func):
+    """写操作执行后清除读缓存，保证后续读取拿到最新数据"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            invalidate_cache()
+
+    return wrapper
+
+
+def invalidate_cache() -> None:
+    """清除所有读查询缓存"""
+    _fetch_players.clear()
+    _fetch_teams.clear()
+    _fetch_change_requests.clear()
+    _fetch_team_change_requests.clear()
+
+
+def run_in_parallel(*calls: Callable[[], Any]) -> List[Any]:
+    """并发执行互不依赖的请求，按参数顺序返回结果（任一失败则抛出异常）"""
+    # 工作线程继承当前脚本上下文，使其中的 st.error / 缓存调用照常工作
+    ctx = get_script_run_ctx()
+    with ThreadPoolExecutor(
+            max_workers=len(calls),
+            initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx)
+    ) as executor:
+        futures = [executor.submit(call) for call in calls]
+        return [future.result() for future in futures]
+
+
+def format_timestamps(values: List[Optional[str]], fmt: str) -> List[Optional[str]]:
+    """批量解析ISO时间字符串并格式化（一次向量化调用），无法解析的返回None"""
+    # 统一换算到UTC，避免不同时区偏移混在一起时整批解析失败
+    parsed = pd.to_datetime(values, format='ISO8601', errors='coerce', utc=True)
+    return [v if isinstance(v, str) else None for v in parsed.strftime(fmt)]
+
+
+def quote_filter_value(value: str) -> str:
+    """为PostgREST逻辑过滤(or/and)中的值加引号并转义，避免ID中的特殊字符破坏过滤条件"""
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
 def convert_tencent_doc_url(doc_url: str) -> Optional[str]:
     """转换腾讯文档URL为API格式"""
     if not doc_url or "docs.qq.com" not in doc_url:
@@ -63,6 +141,19 @@ def convert_tencent_doc_url(doc_url: str) -> Optional[str]:
     return f"https://docs.qq.com/dop-api/opendoc?id={doc_id}&outformat=1&normal=1"
 
 
+@lru_cache(maxsize=8)
+def build_doc_iframe(doc_url: str) -> str:
+    """生成嵌入文档的iframe HTML"""
+    return f"""
+    <iframe src="{doc_url}" 
+            width="100%" 
+            height="800"
+            frameborder="0"
+            allowfullscreen>
+    </iframe>
+    """
+
+
 def notify_team_members(team_id: int, title: str, message: str) -> None:
     """发送通知给队伍成员（模拟函数）"""
     logger.info(f"Notification to team {team_id}: {title} - {message}")
@@ -71,24 +162,60 @@ def notify_team_members(team_id: int, title: str, message: str) -> None:
 # ========================
 # 数据操作模块
 # ========================
+# 读查询缓存：多个会话/重跑共享结果，写操作后由 invalidate_cache() 清除
+@st.cache_data(ttl=30, show_spinner=False)
+def _fetch_players() -> List[Dict]:
+    response = get_supabase().table('players').select("display_id, game_id, class, is_selected").order("display_id").execute()
+    return response.data if response.data else []
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _fetch_teams() -> List[Dict]:
+    response = get_supabase().table('teams').select("id, captain, members, created_at").order("created_at", desc=True).execute()
+    teams = response.data if response.data else []
+
+    # 一次性向量化解析创建时间，渲染队伍卡片时直接读取格式化结果
+    created = format_timestamps([t['created_at'] for t in teams], '%Y-%m-%d %H:%M')
+    for team, created_fmt in zip(teams, created):
+        team['created_at_fmt'] = created_fmt
+    return teams
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _fetch_change_requests(status: Optional[str]) -> List[Dict]:
+    query = get_supabase().table('change_requests').select("*").order("created_at", desc=True)
+    if status:
+        query = query.eq("status", status)
+    response = query.execute()
+    return response.data if response.data else []
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _fetch_team_change_requests(status: Optional[str]) -> List[Dict]:
+    query = get_supabase().table('team_change_requests').select("*").order("created_at", desc=True)
+    if status:
+        query = query.eq("status", status)
+    response = query.execute()
+    return response.data if response.data else []
+
+
 @handle_db_errors
 def load_players() -> pd.DataFrame:
     """加载所有玩家数据"""
-    response = supabase.table('players').select("display_id, game_id, class, is_selected").order("display_id").execute()
-    return pd.DataFrame(response.data if response.data else [])
+    return pa.Table.from_pylist(_fetch_players(), schema=PLAYERS_SCHEMA).to_pandas()
 
 
 @handle_db_errors
 def load_teams() -> List[Dict]:
     """加载所有队伍数据"""
-    response = supabase.table('teams').select("*").order("created_at", desc=True).execute()
-    return response.data if response.data else []
+    return _fetch_teams()
 
 
 @handle_db_errors
+@invalidates_cache
 def add_player(game_id: str, game_class: str) -> bool:
     """添加新玩家"""
-    response = supabase.table('players').insert({
+    response = get_supabase().table('players').insert({
         "game_id": game_id,
         "class": game_class,
         "is_selected": False
@@ -97,68 +224,100 @@ def add_player(game_id: str, game_class: str) -> bool:
 
 
 @handle_db_errors
+@invalidates_cache
 def update_player_selection_status(game_id: str, is_selected: bool) -> bool:
     """更新玩家选择状态"""
-    response = supabase.table('players').update({"is_selected": is_selected}).eq("game_id", game_id).execute()
+    response = get_supabase().table('players').update({"is_selected": is_selected}).eq("game_id", game_id).execute()
     return bool(response.data)
 
 
 @handle_db_errors
-def create_team_in_db(captain: str, members: List[str]) -> bool:
-    """在数据库中创建队伍"""
-    members = [m for m in members if m != captain]
+@invalidates_cache
+def update_players_selection_status(game_ids: List[str], is_selected: bool) -> bool:
+    """批量更新玩家选择状态（单次请求）"""
+    if not game_ids:
+        return True
+    response = get_supabase().table('players').update({"is_selected": is_selected}).in_("game_id", list(game_ids)).execute()
+    return bool(response.data)
+
+
+@st.cache_resource
+def _team_id_counter() -> Dict:
+    return {"lock": threading.Lock(), "next_id": None}
+
+
+def next_team_id(refresh: bool = False) -> int:
+    """分配下一个队伍ID（进程内计数，仅在首次或冲突时查询最大ID）"""
+    counter = _team_id_counter()
+    with counter["lock"]:
+        if refresh or counter["next_id"] is None:
+            response = get_supabase().table('teams').select("id").order("id", desc=True).limit(1).execute()
+            counter["next_id"] = 1 if not response.data else response.data[0]['id'] + 1
+        team_id = counter["next_id"]
+        counter["next_id"] += 1
+        return team_id
+
+
+@handle_db_errors
+@invalidates_cache
+def create_team_in_db(captain: str, members: List[str]) -> Optional[Dict]:
+    """在数据库中创建队伍，成功时返回新队伍记录"""
+    # 去除队长与重复成员（保持原顺序），之后只需校验一次人数
+    members = list(dict.fromkeys(m for m in members if m != captain))
 
     if len(members) + 1 > Config.MAX_TEAM_SIZE:
         st.error(f"队伍人数不能超过{Config.MAX_TEAM_SIZE}人")
-        return False
+        return None
 
     if len(members) + 1 < Config.MIN_TEAM_SIZE:
         st.error(f"队伍人数不能少于{Config.MIN_TEAM_SIZE}人")
-        return False
-
-    # 获取下一个ID
-    max_id_response = supabase.table('teams').select("id").order("id", desc=True).limit(1).execute()
-    next_id = 1 if not max_id_response.data else max_id_response.data[0]['id'] + 1
+        return None
 
-    response = supabase.table('teams').insert({
-        "id": next_id,
+    team_data = {
         "captain": captain,
         "members": members,
         "created_at": datetime.now().isoformat()
-    }).execute()
+    }
+    try:
+        response = get_supabase().table('teams').insert({"id": next_team_id(), **team_data}).execute()
+    except APIError as e:
+        # ID已被占用（其他进程或手动写入），刷新计数后重试一次
+        if e.code != '23505':
+            raise
+        response = get_supabase().table('teams').insert({"id": next_team_id(refresh=True), **team_data}).execute()
 
     if response.data:
         # 批量更新玩家状态
-        update_player_selection_status(captain, True)
-        for member in members:
-            update_player_selection_status(member, True)
-        return True
-    return False
+        update_players_selection_status([captain] + members, True)
+        return response.data[0]
+    return None
 
 
 @handle_db_errors
+@invalidates_cache
 def delete_team_from_db(team_id: int, members: List[str]) -> bool:
     """从数据库删除队伍"""
-    for member in members:
-        update_player_selection_status(member, False)
-    response = supabase.table('teams').delete().eq("id", team_id).execute()
+    update_players_selection_status(members, False)
+    response = get_supabase().table('teams').delete().eq("id", team_id).execute()
     return bool(response.data)
 
 
 @handle_db_errors
+@invalidates_cache
 def update_team_members(team_id: int, members: List[str]) -> bool:
     """更新队伍成员"""
     if len(members) != len(set(members)):
         st.error("成员列表包含重复项")
         return False
-    response = supabase.table('teams').update({"members": members}).eq("id", team_id).execute()
+    response = get_supabase().table('teams').update({"members": members}).eq("id", team_id).execute()
     return bool(response.data)
 
 
 @handle_db_errors
+@invalidates_cache
 def create_change_request(game_id: str, new_game_id: str, new_class: str, status: str = "pending") -> bool:
     """创建更改请求"""
-    response = supabase.table('change_requests').insert({
+    response = get_supabase().table('change_requests').insert({
         "game_id": game_id,
         "new_game_id": new_game_id,
         "new_class": new_class,
@@ -171,21 +330,19 @@ def create_change_request(game_id: str, new_game_id: str, new_class: str, status
 @handle_db_errors
 def load_change_requests(status: str = None) -> List[Dict]:
     """加载更改请求"""
-    query = supabase.table('change_requests').select("*").order("created_at", desc=True)
-    if status:
-        query = query.eq("status", status)
-    response = query.execute()
-    return response.data if response.data else []
+    return _fetch_change_requests(status)
 
 
 @handle_db_errors
+@invalidates_cache
 def update_change_request(request_id: int, status: str) -> bool:
     """更新更改请求状态"""
-    response = supabase.table('change_requests').update({"status": status}).eq("id", request_id).execute()
+    response = get_supabase().table('change_requests').update({"status": status}).eq("id", request_id).execute()
     return bool(response.data)
 
 
 @handle_db_errors
+@invalidates_cache
 def approve_change_request(request: Dict) -> bool:
     old_id = request['game_id']
     new_id = request['new_game_id'] or old_id
@@ -196,12 +353,15 @@ def approve_change_request(request: Dict) -> bool:
 
     try:
         # 1. 获取所有相关队伍（作为队长或成员）
-        teams_response = supabase.table('teams') \
-            .select('id, captain, members') \
-            .or_(f'captain.eq.{old_id},members.cs.["{old_id}"]') \
-            .execute()
-
-        related_teams = teams_response.data if teams_response.data else []
+        # 仅修改职业时队伍数据不变，跳过队伍查询与改写
+        related_teams = []
+        if new_id != old_id:
+            teams_response = get_supabase().table('teams') \
+                .select('id, captain, members') \
+                .or_(f'captain.eq.{quote_filter_value(old_id)},'
+                     f'members.cs.{quote_filter_value(json.dumps([old_id], ensure_ascii=False))}') \
+                .execute()
+            related_teams = teams_response.data if teams_response.data else []
 
         # 2. 处理队长身份的临时转移
         temp_changes = []
@@ -223,7 +383,7 @@ def approve_change_request(request: Dict) -> bool:
                 })
 
                 # 更新临时队长
-                supabase.table('teams') \
+                get_supabase().table('teams') \
                     .update({'captain': temp_captain}) \
                     .eq('id', team['id']) \
                     .execute()
@@ -236,12 +396,14 @@ def approve_change_request(request: Dict) -> bool:
             update_data['class'] = new_class
 
         if update_data:
-            supabase.table('players') \
+            get_supabase().table('players') \
                 .update(update_data) \
                 .eq('game_id', old_id) \
                 .execute()
 
-        # 4. 更新所有相关队伍信息
+        # 4. 更新所有相关队伍信息（各队伍互不依赖，并发提交）
+        sb = get_supabase()
+        team_updates = []
         for team in related_teams:
             # 准备更新数据
             update_team_data = {}
@@ -255,15 +417,16 @@ def approve_change_request(request: Dict) -> bool:
                 updated_members = [new_id if m == old_id else m for m in team['members']]
                 update_team_data['members'] = updated_members
 
-            # 执行更新
             if update_team_data:
-                supabase.table('teams') \
-                    .update(update_team_data) \
-                    .eq('id', team['id']) \
-                    .execute()
+                team_updates.append(
+                    lambda team_id=team['id'], data=update_team_data:
+                    sb.table('teams').update(data).eq('id', team_id).execute()
+                )
+        if team_updates:
+            run_in_parallel(*team_updates)
 
         # 5. 更新请求状态
-        supabase.table('change_requests') \
+        get_supabase().table('change_requests') \
             .update({'status': 'approved'}) \
             .eq('id', request['id']) \
             .execute()
@@ -273,7 +436,7 @@ def approve_change_request(request: Dict) -> bool:
     except Exception as e:
         # 自动回滚机制
         for change in temp_changes:
-            supabase.table('teams') \
+            get_supabase().table('teams') \
                 .update({'captain': change['old_captain']}) \
                 .eq('id', change['team_id']) \
                 .execute()
@@ -282,22 +445,22 @@ def approve_change_request(request: Dict) -> bool:
 
 
 @handle_db_errors
+@invalidates_cache
 def check_and_fix_selection_consistency() -> bool:
     """检查并修复数据一致性"""
     try:
-        players_response = supabase.table('players').select("game_id, is_selected").execute()
+        # 两张表的读取互不依赖，并发执行
+        sb = get_supabase()
+        players_response, teams_response = run_in_parallel(
+            lambda: sb.table('players').select("game_id, is_selected").execute(),
+            lambda: sb.table('teams').select("captain, members").execute()
+        )
         all_players = {p['game_id']: p['is_selected'] for p in players_response.data} if players_response.data else {}
 
-        teams_response = supabase.table('teams').select("captain, members").execute()
-        team_players = set()
-        if teams_response.data:
-            for team in teams_response.data:
-                captain = str(team['captain'])
-                team_players.add(captain)
-                if isinstance(team['members'], list):
-                    for member in team['members']:
-                        member_str = str(member)
-                        team_players.add(member_str)
+        team_players = set(map(str, chain.from_iterable(
+            [team['captain'], *(team['members'] if isinstance(team['members'], list) else [])]
+            for team in teams_response.data or []
+        )))
 
         false_positives = set()
         false_negatives = set()
@@ -307,13 +470,15 @@ def check_and_fix_selection_consistency() -> bool:
             elif not is_selected and game_id in team_players:
                 false_negatives.add(game_id)
 
-        update_count = 0
-        if false_positives:
-            supabase.table('players').update({"is_selected": False}).in_('game_id', list(false_positives)).execute()
-            update_count += len(false_positives)
-        if false_negatives:
-            supabase.table('players').update({"is_selected": True}).in_('game_id', list(false_negatives)).execute()
-            update_count += len(false_negatives)
+        # 两类修正涉及的玩家不重叠，并发提交
+        fixes = [
+            lambda ids=list(ids), value=value:
+            sb.table('players').update({"is_selected": value}).in_('game_id', ids).execute()
+            for ids, value in ((false_positives, False), (false_negatives, True)) if ids
+        ]
+        if fixes:
+            run_in_parallel(*fixes)
+        update_count = len(false_positives) + len(false_negatives)
 
         if false_positives or false_negatives:
             st.success(f"数据一致性检查完成，已修复 {update_count} 条不一致记录!")
@@ -330,7 +495,26 @@ def check_and_fix_selection_consistency() -> bool:
         return False
 
 
+def fetch_team_with_selection(team_id: int, columns: str, game_ids: List[str]) -> Tuple[Optional[Dict], Dict[str, bool]]:
+    """预取队伍信息与相关玩家的选择状态（有玩家需查询时两者并发，玩家状态一次IN查询）"""
+    sb = get_supabase()
+    fetch_team = lambda: sb.table('teams').select(columns).eq('id', team_id).execute()
+    if game_ids:
+        team_response, players_response = run_in_parallel(
+            fetch_team,
+            lambda: sb.table('players').select('game_id, is_selected').in_('game_id', game_ids).execute()
+        )
+        selection = {p['game_id']: p['is_selected'] for p in players_response.data or []}
+    else:
+        team_response = fetch_team()
+        selection = {}
+
+    team = team_response.data[0] if team_response.data else None
+    return team, selection
+
+
 @handle_db_errors
+@invalidates_cache
 def create_team_change_request(
         team_id: int,
         request_type: str,
@@ -353,10 +537,11 @@ def create_team_change_request(
     """
     try:
         # ===== 1. 验证申请者身份 =====
-        team = supabase.table('teams') \
-            .select('captain, members') \
-            .eq('id', team_id) \
-            .single().execute().data
+        team, selection = fetch_team_with_selection(
+            team_id, 'captain, members', [member_to_add] if request_type == "add_member" else []
+        )
+        if not team:
+            raise ValueError("❌ 找不到该队伍")
 
         is_captain = requester_id == team['captain']
         is_member = is_captain or (requester_id in team['members'])
@@ -384,11 +569,9 @@ def create_team_change_request(
 
         elif request_type == "add_member":
             # 验证新成员是否已在其他队伍
-            player_status = supabase.table('players') \
-                .select('is_selected') \
-                .eq('game_id', member_to_add) \
-                .single().execute().data
-            if player_status['is_selected']:
+            if member_to_add not in selection:
+                raise ValueError("❌ 该玩家不存在")
+            if selection[member_to_add]:
                 raise ValueError("❌ 该玩家已加入其他队伍")
             request_data["member_to_add"] = member_to_add
 
@@ -424,7 +607,7 @@ def create_team_change_request(
             raise ValueError("❌ 无效的请求类型")
 
         # ===== 3. 创建请求 =====
-        response = supabase.table('team_change_requests') \
+        response = get_supabase().table('team_change_requests') \
             .insert(request_data) \
             .execute()
 
@@ -445,27 +628,26 @@ def create_team_change_request(
 @handle_db_errors
 def load_team_change_requests(status: str = None) -> List[Dict]:
     """加载队伍变更请求"""
-    query = supabase.table('team_change_requests').select("*").order("created_at", desc=True)
-    if status:
-        query = query.eq("status", status)
-    response = query.execute()
-    return response.data if response.data else []
+    return _fetch_team_change_requests(status)
 
 
 @handle_db_errors
-def approve_team_change_request(request: Dict) -> bool:
-    """审批队伍变更请求（整合智能降级）"""
+@invalidates_cache
+def approve_team_change_request(request: Dict) -> Optional[Dict]:
+    """审批队伍变更请求（整合智能降级），成功时返回更新后的队伍字段"""
     try:
-        # 获取队伍信息
-        team_response = supabase.table('teams') \
-            .select('*') \
-            .eq('id', request['team_id']) \
-            .single().execute()
-        team = team_response.data if team_response.data else None
+        # 获取队伍信息（新增成员时一并预取其选择状态）
+        team, selection = fetch_team_with_selection(
+            request['team_id'],
+            'id, captain, members',
+            [request['member_to_add']] if request['request_type'] == "add_member" else []
+        )
 
         if not team:
             raise ValueError("找不到该队伍")
 
+        team_update = {}
+        selection_update = None  # (玩家ID, 新的选择状态)
         # 情况1：移除成员（含队长智能降级）
         if request['request_type'] == "remove_member":
             member_to_remove = request['member_to_remove']
@@ -477,77 +659,69 @@ def approve_team_change_request(request: Dict) -> bool:
 
                 # 自动选择首位队员为新队长
                 new_captain = team['members'][0]
-                supabase.table('teams') \
-                    .update({
+                team_update = {
                     'captain': new_captain,
                     'members': [m for m in team['members'] if m != new_captain]
-                }) \
-                    .eq('id', team['id']) \
-                    .execute()
+                }
             # 普通成员移除
             else:
-                supabase.table('teams') \
-                    .update({
+                team_update = {
                     'members': [m for m in team['members'] if m != member_to_remove]
-                }) \
-                    .eq('id', team['id']) \
-                    .execute()
+                }
 
-            # 更新玩家状态
-            supabase.table('players') \
-                .update({'is_selected': False}) \
-                .eq('game_id', member_to_remove) \
-                .execute()
+            get_supabase().table('teams').update(team_update).eq('id', team['id']).execute()
+            selection_update = (member_to_remove, False)
 
         # 情况2：变更队长
         elif request['request_type'] == "change_captain":
-            supabase.table('teams') \
-                .update({
+            team_update = {
                 'captain': request['proposed_captain'],
                 'members': [m for m in team['members'] if m != request['proposed_captain']] + [team['captain']]
-            }) \
+            }
+            get_supabase().table('teams') \
+                .update(team_update) \
                 .eq('id', team['id']) \
                 .execute()
 
         # 情况3：添加成员
         elif request['request_type'] == "add_member":
+            if request['member_to_add'] not in selection:
+                raise ValueError("该玩家不存在")
             # 检查成员是否已在其他队伍
-            player_status = supabase.table('players') \
-                .select('is_selected') \
-                .eq('game_id', request['member_to_add']) \
-                .single().execute().data
-
-            if player_status and player_status['is_selected']:
+            if selection.get(request['member_to_add']):
                 raise ValueError("该玩家已加入其他队伍")
 
-            # 添加成员到队伍
-            supabase.table('teams') \
-                .update({
-                'members': team['members'] + [request['member_to_add']]
-            }) \
+            team_update = {'members': team['members'] + [request['member_to_add']]}
+            get_supabase().table('teams') \
+                .update(team_update) \
                 .eq('id', team['id']) \
                 .execute()
+            selection_update = (request['member_to_add'], True)
 
-            # 更新玩家状态
-            supabase.table('players') \
-                .update({'is_selected': True}) \
-                .eq('game_id', request['member_to_add']) \
-                .execute()
-
-        # 更新请求状态
-        supabase.table('team_change_requests') \
+        # 队伍名单写入成功后，再提交玩家状态与请求状态（两者互不依赖，并发执行）
+        sb = get_supabase()
+        mark_approved = lambda: sb.table('team_change_requests') \
             .update({'status': 'approved'}) \
             .eq('id', request['id']) \
             .execute()
+        if selection_update:
+            game_id, is_selected = selection_update
+            run_in_parallel(
+                lambda: sb.table('players').update({'is_selected': is_selected}).eq('game_id', game_id).execute(),
+                mark_approved
+            )
+        else:
+            mark_approved()
 
-        return True
+        return {**team, **team_update}
 
     except Exception as e:
         st.error(f"审批失败: {str(e)}")
-        return False
+        return None
 
 
 @handle_db_errors
+@invalidates_cache
 def update_team_change_request(request_id: int, status: str) -> bool:
     """
     更新队伍变更请求状态
@@ -561,7 +735,7 @@ def update_team_change_request(request_id: int, status: str) -> bool:
         "processed_at": datetime.now().isoformat()
     }
 
-    response = supabase.table('team_change_requests') \
+    response = get_supabase().table('team_change_requests') \
         .update(update_data) \
         .eq('id', request_id) \
         .execute()
@@ -569,9 +743,10 @@ def update_team_change_request(request_id: int, status: str) -> bool:
     return bool(response.data)
 
 @handle_db_errors
+@invalidates_cache
 def update_team_captain(team_id: int, new_captain: str) -> bool:
     """更新队伍队长"""
-    response = supabase.table('teams').select("*").eq("id", team_id).execute()
+    response = get_supabase().table('teams').select("captain, members").eq("id", team_id).execute()
     if not response.data:
         st.error("找不到该队伍!")
         return False
@@ -587,7 +762,7 @@ def update_team_captain(team_id: int, new_captain: str) -> bool:
     updated_members = [m for m in current_members if m != new_captain]
     updated_members.append(current_captain)
 
-    response = supabase.table('teams').update({
+    response = get_supabase().table('teams').update({
         "captain": new_captain,
         "members": updated_members
     }).eq("id", team_id).execute()
@@ -596,9 +771,10 @@ def update_team_captain(team_id: int, new_captain: str) -> bool:
 
 
 @handle_db_errors
+@invalidates_cache
 def remove_member_from_team(team_id: int, member_to_remove: str) -> bool:
     """从队伍中移除成员"""
-    response = supabase.table('teams').select("*").eq("id", team_id).execute()
+    response = get_supabase().table('teams').select("members").eq("id", team_id).execute()
     if not response.data:
         st.error("找不到该队伍!")
         return False
@@ -621,78 +797,178 @@ def remove_member_from_team(team_id: int, member_to_remove: str) -> bool:
 # ========================
 # 页面模块
 # ========================
-def initialize_data():
-    """初始化数据"""
-    if 'players' not in st.session_state:
+def refresh_state(players: bool = True, teams: bool = True) -> None:
+    """重新加载会话中的玩家/队伍数据，两者都需要时并发拉取"""
+    if players and teams:
+        st.session_state.players, st.session_state.teams = run_in_parallel(load_players, load_teams)
+    elif players:
         st.session_state.players = load_players()
-    if 'teams' not in st.session_state:
+    elif teams:
         st.session_state.teams = load_teams()
+
+
+def initialize_data():
+    """初始化数据"""
+    # 冷启动时并发加载会话中尚缺的数据
+    loaders = {
+        'players': load_players,
+        'teams': load_teams,
+        'change_requests': load_change_requests,
+        'team_change_requests': load_team_change_requests,
+    }
+    missing = [key for key in loaders if key not in st.session_state]
+    if missing:
+        for key, value in zip(missing, run_in_parallel(*(loaders[key] for key in missing))):
+            st.session_state[key] = value
     if 'admin_logged_in' not in st.session_state:
         st.session_state.admin_logged_in = False
-    if 'change_requests' not in st.session_state:
-        st.session_state.change_requests = load_change_requests()
-    if 'team_change_requests' not in st.session_state:
-        st.session_state.team_change_requests = load_team_change_requests()
+
+
+def derived_state(name: str, source: Any, build: Callable[[Any], Any]) -> Any:
+    """由会话数据派生并缓存的结果，仅在 source 被重新赋值后重新计算"""
+    cached = st.session_state.get(name)
+    if cached is None or cached[0] is not source:
+        cached = (source, build(source))
+        st.session_state[name] = cached
+    return cached[1]
+
+
+def set_players_selected_in_state(game_ids: List[str], is_selected: bool) -> None:
+    """写库成功后直接更新会话中的玩家组队状态（重新赋值以刷新派生缓存）"""
+    players = st.session_state.players
+    st.session_state.players = players.assign(
+        is_selected=players['is_selected'].mask(players['game_id'].isin(game_ids), is_selected)
+    )
+
+
+def put_team_in_state(team: Dict) -> None:
+    """写库成功后直接更新会话中的队伍列表：已有队伍合并更新字段，新队伍按创建时间倒序置顶"""
+    teams = st.session_state.teams
+    if any(t['id'] == team['id'] for t in teams):
+        st.session_state.teams = [{**t, **team} if t['id'] == team['id'] else t for t in teams]
+    else:
+        if 'created_at_fmt' not in team:
+            team = {**team, 'created_at_fmt': format_timestamps([team.get('created_at')], '%Y-%m-%d %H:%M')[0]}
+        st.session_state.teams = [team] + teams
+
+
+def rename_player_in_state(old_id: str, new_id: str, new_class: Optional[str]) -> None:
+    """信息更改审批通过后，直接在会话数据中更新玩家ID/职业及其所在队伍"""
+    players = st.session_state.players
+    mask = players['game_id'] == old_id
+    changes = {'game_id': players['game_id'].mask(mask, new_id)}
+    if new_class:
+        changes['class'] = players['class'].mask(mask, new_class)
+    st.session_state.players = players.assign(**changes)
+
+    if new_id != old_id:
+        st.session_state.teams = [
+            {
+                **t,
+                'captain': new_id if t['captain'] == old_id else t['captain'],
+                'members': [new_id if m == old_id else m for m in t['members']]
+            } if t['captain'] == old_id or old_id in t['members'] else t
+            for t in st.session_state.teams
+        ]
+
+
+def get_player_class_map() -> Dict[str, str]:
+    """游戏ID→职业映射"""
+    return derived_state(
+        '_class_by_id',
+        st.session_state.players,
+        lambda players: {} if players.empty else dict(zip(players['game_id'], players['class']))
+    )
+
+
+def get_players_display() -> pd.DataFrame:
+    """中文列名的玩家表（供名单展示与管理编辑共用）"""
+    return derived_state('_players_display', st.session_state.players, lambda players: players.rename(columns=PLAYER_COLUMN_LABELS))
+
+
+def get_teams_by_id() -> Dict[int, Dict]:
+    """队伍ID→队伍数据索引"""
+    return derived_state('_teams_by_id', st.session_state.teams, lambda teams: {t['id']: t for t in teams})
+
+
+def get_team_player_set() -> frozenset:
+    """所有队伍成员（含队长）的游戏ID集合"""
+    return derived_state(
+        '_team_players',
+        st.session_state.teams,
+        lambda teams: frozenset(chain.from_iterable([t['captain'], *t['members']] for t in teams))
+    )
+
+
+def get_all_player_ids() -> List[str]:
+    """所有玩家的游戏ID列表（保持名单顺序）"""
+    return derived_state('_all_player_ids', st.session_state.players, lambda players: players['game_id'].tolist())
+
+
+def get_available_player_ids() -> List[str]:
+    """未组队玩家的游戏ID列表（保持名单顺序）"""
+    return derived_state(
+        '_available_player_ids',
+        st.session_state.players,
+        lambda players: players.loc[~players['is_selected'], 'game_id'].tolist()
+    )
+
+
+def highlight_selected_rows(df: pd.DataFrame) -> pd.DataFrame:
+    """已组队玩家整行置灰（一次向量化生成整表样式）"""
+    mask = np.broadcast_to(df['已选择'].to_numpy(dtype=bool)[:, None], df.shape)
+    return pd.DataFrame(np.where(mask, 'background: #f5f5f5', ''), index=df.index, columns=df.columns)
+
+
+def get_players_styled() -> 'pd.io.formats.style.Styler':
+    """已组队行置灰的玩家展示表（样式只在玩家数据变化时计算一次）"""
+    def build(_players):
+        display = get_players_display()
+        css = highlight_selected_rows(display)
+        # 渲染时 Streamlit 会重新执行样式函数，这里直接返回已算好的样式表
+        return display.style.apply(lambda _: css, axis=None)
+    return derived_state('_players_styled', st.session_state.players, build)
 
 
 def display_team_info(team: Dict, show_disband_button: bool = False) -> None:
     """显示队伍信息"""
-    members_info = []
-    for member in team['members']:
-        if member == team['captain']:
-            continue
-        player = st.session_state.players[st.session_state.players['game_id'] == member]
-        members_info.append({
-            '游戏ID': member,
-            '游戏职业': player['class'].values[0] if not player.empty else "未知"
-        })
+    class_by_id = get_player_class_map()
+    # 队长在前，逐行构建表格记录
+    rows = [{'角色': '队长', '游戏ID': team['captain'], '游戏职业': class_by_id.get(team['captain'], "未知")}]
+    rows.extend(
+        {'角色': '队员', '游戏ID': member, '游戏职业': class_by_id.get(member, "未知")}
+        for member in team['members'] if member != team['captain']
+    )
 
     cols = st.columns([1, 3])
     with cols[0]:
         st.metric("队伍ID", team['id'])
         st.metric("队长", team['captain'])
-        st.metric("当前人数", f"{len(members_info) + 1}/{Config.MAX_TEAM_SIZE}")
-        if 'created_at' in team:
-            created_time = pd.to_datetime(team['created_at']).strftime('%Y-%m-%d %H:%M')
-            st.metric("创建时间", created_time)
+        st.metric("当前人数", f"{len(rows)}/{Config.MAX_TEAM_SIZE}")
+        if team.get('created_at_fmt'):
+            st.metric("创建时间", team['created_at_fmt'])
 
     with cols[1]:
-        df_data = {
-            '角色': ['队长'],
-            '游戏ID': [team['captain']],
-            '游戏职业': [
-                st.session_state.players[st.session_state.players['game_id'] == team['captain']]['class'].values[0]
-                if not st.session_state.players[st.session_state.players['game_id'] == team['captain']].empty
-                else "未知"
-            ]
-        }
-
-        if members_info:
-            df_data['角色'].extend(['队员'] * len(members_info))
-            df_data['游戏ID'].extend([m['游戏ID'] for m in members_info])
-            df_data['游戏职业'].extend([m['游戏职业'] for m in members_info])
-
-        st.dataframe(pd.DataFrame(df_data), hide_index=True, use_container_width=True)
+        st.dataframe(pd.DataFrame.from_records(rows), hide_index=True, use_container_width=True)
 
     if show_disband_button and st.button(f"解散队伍{team['id']}", key=f"disband_{team['id']}"):
-        if delete_team_from_db(team['id'], [team['captain']] + team['members']):
-            st.session_state.teams = load_teams()
-            st.session_state.players = load_players()
-            st.rerun()
+        team_players = [team['captain']] + team['members']
+        if delete_team_from_db(team['id'], team_players):
+            # 直接在会话数据上应用变更，只重跑所在的队伍列表片段
+            st.session_state.teams = [t for t in st.session_state.teams if t['id'] != team['id']]
+            set_players_selected_in_state(team_players, False)
+            st.rerun(scope="fragment")
 
 
-def display_request_details(request: Dict) -> None:
-    """显示请求详情"""
-    player = supabase.table('players') \
-        .select('class') \
-        .eq('game_id', request['game_id']) \
-        .single().execute().data
+def display_request_details(request: Dict, submitted_time: Optional[str]) -> None:
+    """显示请求详情（提交时间由调用方按页批量格式化）"""
+    current_class = get_player_class_map().get(request['game_id'], '未知')
 
     col1, col2 = st.columns(2)
     with col1:
         st.markdown("**当前信息**")
         st.write(f"游戏ID: `{request['game_id']}`")
-        st.write(f"职业: `{player['class'] if player else '未知'}`")
+        st.write(f"职业: `{current_class}`")
 
     with col2:
         st.markdown("**请求更改**")
@@ -700,7 +976,7 @@ def display_request_details(request: Dict) -> None:
         if request['new_game_id']:
             changes.append(f"ID: `{request['game_id']}` → `{request['new_game_id']}`")
         if request['new_class']:
-            changes.append(f"职业: `{player['class']}` → `{request['new_class']}`")
+            changes.append(f"职业: `{current_class}` → `{request['new_class']}`")
 
         if changes:
             for change in changes:
@@ -708,7 +984,7 @@ def display_request_details(request: Dict) -> None:
         else:
             st.warning("无有效更改内容")
 
-    st.write(f"提交时间: `{pd.to_datetime(request['created_at']).strftime('%Y-%m-%d %H:%M')}`")
+    st.write(f"提交时间: `{submitted_time}`")
     if request.get('reason'):
         st.text_area("申请理由", value=request['reason'], disabled=True)
 
@@ -722,15 +998,7 @@ def main_page():
 
     st.header("👥 玩家名单")
     st.dataframe(
-        st.session_state.players.rename(columns={
-            'display_id': '序号',
-            'game_id': '游戏ID',
-            'class': '游戏职业',
-            'is_selected': '已选择'
-        }).style.apply(
-            lambda row: ['background: #f5f5f5'] * len(row) if row['已选择'] else [''] * len(row),
-            axis=1
-        ),
+        get_players_styled(),
         column_order=["序号", "游戏ID", "游戏职业", "已选择"],
         hide_index=True,
         use_container_width=True,
@@ -738,17 +1006,14 @@ def main_page():
     )
 
     st.header("🛠️ 创建队伍")
-    available_captains = st.session_state.players[~st.session_state.players['is_selected']]['game_id']
-    if len(available_captains) == 0:
+    available_captains = get_available_player_ids()
+    if not available_captains:
         st.warning("没有可选的队长，所有玩家已被组队")
         return
 
     captain = st.selectbox("选择队长:", options=available_captains, key='captain')
 
-    available = st.session_state.players[
-        (~st.session_state.players['is_selected']) &
-        (st.session_state.players['game_id'] != captain)
-        ]['game_id']
+    available = [g for g in available_captains if g != captain]
     selected = st.multiselect("选择队员 (2-5人):", options=available, key='members')
 
     if captain and selected:
@@ -756,10 +1021,8 @@ def main_page():
         try:
             team_members = [captain] + selected
             roles = ['队长'] + ['队员'] * len(selected)
-            classes = []
-            for member in team_members:
-                player_data = st.session_state.players[st.session_state.players['game_id'] == member]
-                classes.append(player_data['class'].values[0] if not player_data.empty else '未知职业')
+            class_by_id = get_player_class_map()
+            classes = [class_by_id.get(member, '未知职业') for member in team_members]
 
             st.dataframe(pd.DataFrame({
                 '角色': roles,
@@ -770,10 +1033,22 @@ def main_page():
             st.error(f"创建预览失败: {str(e)}")
 
     if st.button("✅ 确认组队"):
-        if Config.MIN_TEAM_SIZE <= len(selected) + 1 <= Config.MAX_TEAM_SIZE:
-            if create_team_in_db(captain, selected):
-                st.success("组队成功!")
-                time.sleep(1)
+        team_members = {captain, *selected}
+        # 名单可能已被管理员修改，先确认玩家仍存在
+        missing = team_members - get_player_class_map().keys()
+        # 选择状态可能与队伍数据不一致，按实际队伍名单（含其他队队长）再校验一次
+        conflict = team_members & get_team_player_set()
+        if missing:
+            st.error(f"玩家 {', '.join(sorted(missing))} 不存在")
+        elif conflict:
+            st.error(f"以下玩家已在其他队伍: {', '.join(sorted(conflict))}")
+        elif Config.MIN_TEAM_SIZE <= len(selected) + 1 <= Config.MAX_TEAM_SIZE:
+            new_team = create_team_in_db(captain, selected)
+            if new_team:
+                # 直接把新队伍写入会话数据，无需重新拉取玩家与队伍
+                put_team_in_state(new_team)
+                set_players_selected_in_state([new_team['captain'], *new_team['members']], True)
+                st.toast("组队成功!", icon="✅")
                 st.rerun()
         else:
             st.error(f"请选择{Config.MIN_TEAM_SIZE - 1}到{Config.MAX_TEAM_SIZE - 1}名队员!")
@@ -785,10 +1060,9 @@ def check_admin_password():
         st.header("管理员登录")
         password = st.text_input("密码:", type="password", key="admin_pwd")
         if st.button("登录"):
-            if hashlib.sha256(password.encode()).hexdigest() == Config.ADMIN_PASSWORD_HASH:
+            if hmac.compare_digest(hashlib.sha256(password.encode()).digest(), get_admin_password_hash()):
                 st.session_state.admin_logged_in = True
-                st.success("登录成功!")
-                time.sleep(1)
+                st.toast("登录成功!", icon="✅")
                 st.rerun()
             else:
                 st.error("密码错误!")
@@ -805,43 +1079,34 @@ def show_activity_page():
         st.warning("当前未配置活动文档，请联系管理员")
         return
 
-    st.markdown(f"""
-    <iframe src="{Config.TENCENT_DOC_URL}" 
-            width="100%" 
-            height="800"
-            frameborder="0"
-            allowfullscreen>
-    </iframe>
-    """, unsafe_allow_html=True)
+    st.markdown(build_doc_iframe(Config.TENCENT_DOC_URL), unsafe_allow_html=True)
 
 
 def show_change_info_page():
     """显示信息更改页面"""
     st.title("✏️ 信息更改")
-    players = st.session_state.players
-
-    game_id = st.selectbox("选择您的游戏ID", options=players['game_id'].tolist(), key="change_info_game_id")
+    game_id = st.selectbox("选择您的游戏ID", options=get_all_player_ids(), key="change_info_game_id")
 
     if game_id:
-        player_info = players[players['game_id'] == game_id].iloc[0]
+        current_class = get_player_class_map()[game_id]
         st.subheader("当前信息")
         cols = st.columns(2)
         with cols[0]:
-            st.text_input("当前游戏ID", value=player_info['game_id'], disabled=True)
+            st.text_input("当前游戏ID", value=game_id, disabled=True)
         with cols[1]:
-            st.text_input("当前职业", value=player_info['class'], disabled=True)
+            st.text_input("当前职业", value=current_class, disabled=True)
 
         st.subheader("更改信息")
         new_game_id = st.text_input("新游戏ID (如不需更改请留空)", key="new_game_id")
         new_class = st.selectbox(
             "新职业 (如不需更改请选择当前职业)",
-            options=Config.GAME_CLASSES,
-            index=Config.GAME_CLASSES.index(player_info['class']) if player_info['class'] in Config.GAME_CLASSES else 0,
+            options=Config.GAME_CLASSES_ORDERED,
+            index=Config.GAME_CLASS_INDEX.get(current_class, 0),
             key="new_class"
         )
 
         if st.button("提交更改请求"):
-            if not new_game_id and new_class == player_info['class']:
+            if not new_game_id and new_class == current_class:
                 st.warning("请至少修改一项信息")
             else:
                 if create_change_request(
@@ -858,12 +1123,13 @@ def show_incomplete_teams():
     """显示未满队伍"""
     st.title("🟡 未满的队伍")
 
-    if not st.session_state.teams:
+    teams = st.session_state.teams
+    if not teams:
         st.info("暂无组队记录")
         return
 
-    available_players = set(st.session_state.players[~st.session_state.players['is_selected']]['game_id'])
-    incomplete_teams = [team for team in st.session_state.teams if (1 + len(team['members'])) < Config.MAX_TEAM_SIZE]
+    available_players = get_available_player_ids()
+    incomplete_teams = [team for team in teams if (1 + len(team['members'])) < Config.MAX_TEAM_SIZE]
 
     if not incomplete_teams:
         st.success("🎉 所有队伍都已满员!")
@@ -881,16 +1147,18 @@ def show_incomplete_teams():
                 st.subheader("添加新成员")
                 new_member = st.selectbox(
                     "选择要添加的成员",
-                    options=list(available_players),
+                    options=available_players,
                     key=f"add_member_{team['id']}"
                 )
 
                 if st.button(f"添加到队伍 {team['id']}", key=f"add_btn_{team['id']}"):
                     with st.spinner("添加中，请稍候..."):
-                        if update_team_members(team['id'], team['members'] + [new_member]):
+                        new_members = team['members'] + [new_member]
+                        if update_team_members(team['id'], new_members):
                             update_player_selection_status(new_member, True)
-                            st.success(f"✅ 已成功将 {new_member} 添加到队伍 {team['id']}!")
-                            time.sleep(1.5)
+                            put_team_in_state({**team, 'members': new_members})
+                            set_players_selected_in_state([new_member], True)
+                            st.toast(f"已成功将 {new_member} 添加到队伍 {team['id']}!", icon="✅")
                             st.rerun()
             else:
                 st.warning("没有可用的玩家可以添加")
@@ -900,27 +1168,127 @@ def show_team_list():
     """显示队伍列表"""
     st.title("🏆 组队列表")
 
-    if not st.session_state.teams:
+    teams = st.session_state.teams
+    if not teams:
         st.info("暂无组队记录")
         return
 
-    st.subheader(f"当前共有 {len(st.session_state.teams)} 支队伍")
+    st.subheader(f"当前共有 {len(teams)} 支队伍")
+
+    # 分页渲染，每页只生成当前页的队伍卡片
+    page_size = 20
+    total_pages = (len(teams) + page_size - 1) // page_size
+    page = st.number_input("页码", min_value=1, max_value=total_pages, value=1, key="team_list_page") if total_pages > 1 else 1
 
-    for team in st.session_state.teams:
+    start_idx = (page - 1) * page_size
+    for team in teams[start_idx:start_idx + page_size]:
         with st.expander(f"队伍 {team['id']} - 队长: {team['captain']}", expanded=True):
             display_team_info(team)
 
 
+@st.fragment
+def captain_change_form(team: Dict, requester_id: str) -> None:
+    """队长变更申请表单（独立片段，表单交互时只重跑本表单而非整页）"""
+    team_id = team['id']
+    all_members = [team['captain']] + team['members']
+    current_captain = team['captain']
+
+    proposed_captain = st.selectbox(
+        "选择新队长",
+        options=all_members,
+        index=all_members.index(current_captain),
+        key=f"new_captain_{team_id}"
+    )
+
+    reason = st.text_area("变更原因", key=f"captain_reason_{team_id}")
+
+    if st.button("提交队长变更申请", key=f"submit_captain_change_{team_id}"):
+        if proposed_captain == current_captain:
+            st.warning("请选择不同的玩家作为新队长")
+        else:
+            with st.spinner("提交中..."):
+                if create_team_change_request(
+                        team_id=team_id,
+                        request_type="change_captain",
+                        requester_id=requester_id,
+                        proposed_captain=proposed_captain,
+                        reason=reason
+                ):
+                    st.success("队长变更申请已提交，请等待管理员审批!")
+                else:
+                    st.error("提交申请失败")
+
+
+@st.fragment
+def remove_member_form(team: Dict, requester_id: str) -> None:
+    """成员移除申请表单"""
+    team_id = team['id']
+    if not team['members']:
+        st.info("该队伍没有可移除的成员")
+    else:
+        member_to_remove = st.selectbox(
+            "选择要移除的成员",
+            options=team['members'],
+            key=f"remove_member_{team_id}"
+        )
+
+        reason = st.text_area("移除原因", key=f"remove_reason_{team_id}")
+
+        if st.button("提交成员移除申请", key=f"submit_remove_{team_id}"):
+            with st.spinner("提交中..."):
+                if create_team_change_request(
+                        team_id=team_id,
+                        request_type="remove_member",
+                        requester_id=requester_id,
+                        member_to_remove=member_to_remove,
+                        reason=reason
+                ):
+                    st.success("成员移除申请已提交，请等待管理员审批!")
+                else:
+                    st.error("提交申请失败")
+
+
+@st.fragment
+def add_member_form(team: Dict, requester_id: str) -> None:
+    """新增成员申请表单"""
+    team_id = team['id']
+    available_players = get_available_player_ids()
+    if not available_players:
+        st.info("没有可用的玩家可以添加")
+    else:
+        member_to_add = st.selectbox(
+            "选择要添加的成员",
+            options=available_players,
+            key=f"add_member_{team_id}"
+        )
+
+        reason = st.text_area("添加原因", key=f"add_reason_{team_id}")
+
+        if st.button("提交新增成员申请", key=f"submit_add_{team_id}"):
+            with st.spinner("提交中..."):
+                if create_team_change_request(
+                        team_id=team_id,
+                        request_type="add_member",
+                        requester_id=requester_id,
+                        member_to_add=member_to_add,
+                        reason=reason
+                ):
+                    st.success("新增成员申请已提交，请等待管理员审批!")
+                else:
+                    st.error("提交申请失败")
+
+
 def show_team_modification_page():
     """显示队伍变更请求页面"""
     st.title("🔄 队伍变更请求")
 
-    if not st.session_state.teams:
+    teams = st.session_state.teams
+    if not teams:
         st.info("暂无队伍")
         return
 
     # 创建队伍选项列表，格式为"队伍ID - 队长名称"
-    team_options = [(team['id'], team['captain']) for team in st.session_state.teams]
+    team_options = [(team['id'], team['captain']) for team in teams]
 
     # 使用selectbox显示队伍选择
     selected_option = st.selectbox(
@@ -936,7 +1304,7 @@ def show_team_modification_page():
     if not team_id:
         return
 
-    selected_team = next((team for team in st.session_state.teams if team['id'] == team_id), None)
+    selected_team = get_teams_by_id().get(team_id)
     if not selected_team:
         st.error("找不到该队伍!")
         return
@@ -953,84 +1321,76 @@ def show_team_modification_page():
         return
 
     with st.expander("申请变更队长"):
-        all_members = [selected_team['captain']] + selected_team['members']
-        current_captain = selected_team['captain']
-
-        proposed_captain = st.selectbox(
-            "选择新队长",
-            options=all_members,
-            index=all_members.index(current_captain),
-            key=f"new_captain_{team_id}"
-        )
+        captain_change_form(selected_team, requester_id)
 
-        reason = st.text_area("变更原因", key=f"captain_reason_{team_id}")
+    with st.expander("申请移除成员"):
+        remove_member_form(selected_team, requester_id)
 
-        if st.button("提交队长变更申请", key=f"submit_captain_change_{team_id}"):
-            if proposed_captain == current_captain:
-                st.warning("请选择不同的玩家作为新队长")
-            else:
-                with st.spinner("提交中..."):
-                    if create_team_change_request(
-                            team_id=team_id,
-                            request_type="change_captain",
-                            requester_id=requester_id,
-                            proposed_captain=proposed_captain,
-                            reason=reason
-                    ):
-                        st.success("队长变更申请已提交，请等待管理员审批!")
-                    else:
-                        st.error("提交申请失败")
+    with st.expander("申请新增成员"):
+        add_member_form(selected_team, requester_id)
 
-    with st.expander("申请移除成员"):
-        if not selected_team['members']:
-            st.info("该队伍没有可移除的成员")
-        else:
-            member_to_remove = st.selectbox(
-                "选择要移除的成员",
-                options=selected_team['members'],
-                key=f"remove_member_{team_id}"
-            )
 
-            reason = st.text_area("移除原因", key=f"remove_reason_{team_id}")
-
-            if st.button("提交成员移除申请", key=f"submit_remove_{team_id}"):
-                with st.spinner("提交中..."):
-                    if create_team_change_request(
-                            team_id=team_id,
-                            request_type="remove_member",
-                            requester_id=requester_id,
-                            member_to_remove=member_to_remove,
-                            reason=reason
-                    ):
-                        st.success("成员移除申请已提交，请等待管理员审批!")
-                    else:
-                        st.error("提交申请失败")
+@st.fragment
+def show_admin_team_list():
+    """管理员队伍列表（解散队伍时仅局部刷新）"""
+    teams = st.session_state.teams
+    if not teams:
+        st.info("暂无队伍")
+        return
+    for team in teams:
+        with st.expander(f"队伍{team['id']}-队长:{team['captain']}"):
+            display_team_info(team, show_disband_button=True)
 
-    with st.expander("申请新增成员"):
-        available_players = set(st.session_state.players[~st.session_state.players['is_selected']]['game_id'])
-        if not available_players:
-            st.info("没有可用的玩家可以添加")
-        else:
-            member_to_add = st.selectbox(
-                "选择要添加的成员",
-                options=list(available_players),
-                key=f"add_member_{team_id}"
-            )
 
-            reason = st.text_area("添加原因", key=f"add_reason_{team_id}")
+@st.fragment
+def show_pending_change_requests():
+    """待审批的信息更改请求列表（翻页与拒绝只重跑本片段）"""
+    requests = load_change_requests("pending")
+    if not requests:
+        st.info("没有待审批的更改请求")
+        return
+
+    # 分页控制
+    page_size = 5
+    total_pages = (len(requests) + page_size - 1) // page_size
+    page = st.number_input("页码", min_value=1, max_value=total_pages, value=1)
 
-            if st.button("提交新增成员申请", key=f"submit_add_{team_id}"):
-                with st.spinner("提交中..."):
-                    if create_team_change_request(
-                            team_id=team_id,
-                            request_type="add_member",
-                            requester_id=requester_id,
-                            member_to_add=member_to_add,
-                            reason=reason
-                    ):
-                        st.success("新增成员申请已提交，请等待管理员审批!")
-                    else:
-                        st.error("提交申请失败")
+    start_idx = (page - 1) * page_size
+    end_idx = min(start_idx + page_size, len(requests))
+    page_requests = requests[start_idx:end_idx]
+
+    # 一次查询统计本页玩家担任队长的队伍数
+    captain_rows = get_supabase().table('teams') \
+        .select("captain") \
+        .in_("captain", list({req['game_id'] for req in page_requests})) \
+        .execute().data
+    captain_counts = Counter(row['captain'] for row in captain_rows or [])
+    submitted_times = format_timestamps([req['created_at'] for req in page_requests], '%Y-%m-%d %H:%M')
+
+    for req, submitted_time in zip(page_requests, submitted_times):
+        with st.container():
+            st.markdown(f"### 请求ID: {req['id']} - 玩家: {req['game_id']}")
+
+            # 显示队长影响提示
+            if captain_counts[req['game_id']]:
+                st.warning(f"⚠️ 该玩家是 {captain_counts[req['game_id']]} 支队伍的队长")
+
+            cols = st.columns([3, 1])
+            with cols[0]:
+                display_request_details(req, submitted_time)
+            with cols[1]:
+                if st.button("批准", key=f"approve_{req['id']}"):
+                    if approve_change_request(req):
+                        st.toast("批准成功", icon="✅")
+                        # 改名/改职业会同时影响玩家表和队伍名单，需整页重跑
+                        rename_player_in_state(req['game_id'], req['new_game_id'] or req['game_id'], req['new_class'])
+                        st.rerun()
+                if st.button("拒绝", key=f"reject_{req['id']}"):
+                    if update_change_request(req['id'], "rejected"):
+                        st.toast("已拒绝", icon="✅")
+                        st.rerun(scope="fragment")
+
+            st.markdown("---")
 
 
 def admin_panel():
@@ -1047,46 +1407,48 @@ def admin_panel():
             with cols[0]:
                 new_id = st.text_input("游戏ID", key="new_id")
             with cols[1]:
-                new_class = st.selectbox("职业", Config.GAME_CLASSES, key="new_class")
+                new_class = st.selectbox("职业", Config.GAME_CLASSES_ORDERED, key="new_class")
             if st.button("添加") and new_id:
                 if add_player(new_id, new_class):
-                    st.session_state.players = load_players()
+                    refresh_state(teams=False)
                     st.rerun()
 
         st.subheader("当前玩家")
         edited_df = st.data_editor(
-            st.session_state.players.rename(columns={
-                'display_id': '序号',
-                'game_id': '游戏ID',
-                'class': '游戏职业',
-                'is_selected': '已选择'
-            }),
+            get_players_display(),
             column_order=["序号", "游戏ID", "游戏职业", "已选择"],
             num_rows="dynamic",
             column_config={
                 "序号": st.column_config.NumberColumn(width="small", disabled=True),
                 "游戏ID": st.column_config.TextColumn(width="medium"),
-                "游戏职业": st.column_config.SelectboxColumn(options=Config.GAME_CLASSES),
+                "游戏职业": st.column_config.SelectboxColumn(options=Config.GAME_CLASSES_ORDERED),
                 "已选择": st.column_config.CheckboxColumn(disabled=True)
             },
             hide_index=True
         )
 
         if st.button("保存修改"):
-            updated_players = edited_df.rename(columns={
-                '序号': 'display_id',
-                '游戏ID': 'game_id',
-                '游戏职业': 'class',
-                '已选择': 'is_selected'
-            })
+            updated_players = edited_df.rename(columns={label: col for col, label in PLAYER_COLUMN_LABELS.items()})
+            # 编辑器中新增的空行没有序号，与原逻辑一样不写入
+            columns = ['game_id', 'class', 'is_selected']
+            edited = updated_players.dropna(subset=['display_id']) \
+                .astype({'display_id': 'int64'}) \
+                .set_index('display_id')[columns]
+            original = st.session_state.players.set_index('display_id')[columns]
+
+            # 只提交与当前数据不同的行
+            before = original.reindex(edited.index)
+            changed = edited[((edited != before) & ~(edited.isna() & before.isna())).any(axis=1)]
             try:
-                for _, row in updated_players.iterrows():
-                    supabase.table('players').update({
-                        'game_id': row['game_id'],
-                        'class': row['class'],
-                        'is_selected': row['is_selected']
-                    }).eq('display_id', row['display_id']).execute()
-                st.session_state.players = load_players()
+                if not changed.empty:
+                    get_supabase().table('players').upsert(
+                        changed.reset_index().to_dict('records'), on_conflict='display_id'
+                    ).execute()
+                    invalidate_cache()
+                    # 将修改直接合并进会话数据，无需重新拉取整表
+                    patched = original.copy()
+                    patched.loc[changed.index, columns] = changed
+                    st.session_state.players = patched.reset_index()
                 st.success("修改已保存!")
                 st.rerun()
             except Exception as e:
@@ -1094,20 +1456,16 @@ def admin_panel():
 
         if st.button("重置选择状态"):
             try:
-                supabase.table('players').update({"is_selected": False}).neq("game_id", "").execute()
-                st.session_state.players = load_players()
+                get_supabase().table('players').update({"is_selected": False}).neq("game_id", "").execute()
+                invalidate_cache()
+                refresh_state(teams=False)
                 st.rerun()
             except Exception as e:
                 st.error(f"重置失败: {str(e)}")
 
     with tab2:
         st.subheader("队伍管理")
-        if not st.session_state.teams:
-            st.info("暂无队伍")
-            return
-        for team in st.session_state.teams:
-            with st.expander(f"队伍{team['id']}-队长:{team['captain']}"):
-                display_team_info(team, show_disband_button=True)
+        show_admin_team_list()
 
     with tab3:
         st.subheader("数据一致性维护")
@@ -1120,23 +1478,18 @@ def admin_panel():
         if st.button("执行数据一致性检查"):
             with st.spinner("正在检查数据一致性..."):
                 if check_and_fix_selection_consistency():
-                    st.session_state.players = load_players()
-                    st.session_state.teams = load_teams()
+                    refresh_state()
                     st.rerun()
 
         st.subheader("当前数据状态")
-        selected_players = set(st.session_state.players[st.session_state.players['is_selected']]['game_id'])
-        team_players = set()
-        for team in st.session_state.teams:
-            team_players.add(team['captain'])
-            team_players.update(team['members'])
-
-        inconsistent_players = selected_players - team_players
-        if inconsistent_players:
-            st.warning(f"发现 {len(inconsistent_players)} 条不一致记录:")
-            st.dataframe(st.session_state.players[
-                st.session_state.players['game_id'].isin(inconsistent_players)
-            ][['display_id', 'game_id', 'class']].rename(columns={
+        # 标记为已选择但不在任何队伍中的玩家（单次向量化判断）
+        players = st.session_state.players
+        inconsistent_mask = players['is_selected'].to_numpy(dtype=bool) & \
+            ~players['game_id'].isin(get_team_player_set()).to_numpy()
+        inconsistent_count = int(inconsistent_mask.sum())
+        if inconsistent_count:
+            st.warning(f"发现 {inconsistent_count} 条不一致记录:")
+            st.dataframe(players.loc[inconsistent_mask, ['display_id', 'game_id', 'class']].rename(columns={
                 'display_id': '序号',
                 'game_id': '游戏ID',
                 'class': '职业'
@@ -1161,51 +1514,7 @@ def admin_panel():
     with tab5:
         st.subheader("待审批的玩家信息更改请求")
 
-        def show_pending_requests():
-            requests = load_change_requests("pending")
-            if not requests:
-                st.info("没有待审批的更改请求")
-                return
-
-            # 分页控制
-            page_size = 5
-            total_pages = (len(requests) + page_size - 1) // page_size
-            page = st.number_input("页码", min_value=1, max_value=total_pages, value=1)
-
-            start_idx = (page - 1) * page_size
-            end_idx = min(start_idx + page_size, len(requests))
-
-            for i in range(start_idx, end_idx):
-                req = requests[i]
-                with st.container():
-                    st.markdown(f"### 请求ID: {req['id']} - 玩家: {req['game_id']}")
-
-                    # 显示队长影响提示
-                    captain_teams = supabase.table('teams') \
-                        .select("id") \
-                        .eq("captain", req['game_id']) \
-                        .execute().data
-                    if captain_teams:
-                        st.warning(f"⚠️ 该玩家是 {len(captain_teams)} 支队伍的队长")
-
-                    cols = st.columns([3, 1])
-                    with cols[0]:
-                        display_request_details(req)
-                    with cols[1]:
-                        if st.button("批准", key=f"approve_{req['id']}"):
-                            if approve_change_request(req):
-                                st.success("批准成功")
-                                time.sleep(1)
-                                st.rerun()
-                        if st.button("拒绝", key=f"reject_{req['id']}"):
-                            if update_change_request(req['id'], "rejected"):
-                                st.success("已拒绝")
-                                time.sleep(1)
-                                st.rerun()
-
-                    st.markdown("---")
-
-        show_pending_requests()
+        show_pending_change_requests()
 
     with tab6:
         st.subheader("待审批的队伍变更请求")
@@ -1214,20 +1523,18 @@ def admin_panel():
         if not pending_requests:
             st.info("没有待审批的队伍变更请求")
         else:
-            for request in pending_requests:
+            submitted_times = format_timestamps([r['created_at'] for r in pending_requests], '%Y-%m-%d %H:%M:%S')
+            for request, submitted_time in zip(pending_requests, submitted_times):
                 with st.container():
                     st.markdown(f"### 请求ID: {request['id']} - 队伍: {request['team_id']}")
 
-                    team_response = supabase.table('teams').select("*").eq("id", request['team_id']).execute()
-                    team = team_response.data[0] if team_response.data else None
-
                     col1, col2 = st.columns(2)
                     with col1:
                         st.markdown("**基本信息**")
                         st.write(
                             f"请求类型: `{'变更队长' if request['request_type'] == 'change_captain' else '移除成员' if request['request_type'] == 'remove_member' else '新增成员'}`")
                         st.write(f"请求者: `{request['requester_id']}`")
-                        st.write(f"提交时间: `{pd.to_datetime(request['created_at']).strftime('%Y-%m-%d %H:%M:%S')}`")
+                        st.write(f"提交时间: `{submitted_time}`")
                         if request['reason']:
                             st.markdown("**申请理由**")
                             st.write(request['reason'])
@@ -1247,11 +1554,15 @@ def admin_panel():
                     with action_col1:
                         if st.button(f"✅ 批准", key=f"approve_team_req_{request['id']}"):
                             with st.spinner("处理中..."):
-                                if approve_team_change_request(request):
-                                    st.success("已批准队伍变更请求")
-                                    st.session_state.teams = load_teams()
-                                    st.session_state.players = load_players()
-                                    time.sleep(1)
+                                updated_team = approve_team_change_request(request)
+                                if updated_team:
+                                    st.toast("已批准队伍变更请求", icon="✅")
+                                    # 直接把变更应用到会话数据，无需重新拉取玩家与队伍
+                                    put_team_in_state(updated_team)
+                                    if request['request_type'] == "remove_member":
+                                        set_players_selected_in_state([request['member_to_remove']], False)
+                                    elif request['request_type'] == "add_member":
+                                        set_players_selected_in_state([request['member_to_add']], True)
                                     st.rerun()
                                 else:
                                     st.error("批准失败")
@@ -1259,8 +1570,7 @@ def admin_panel():
                         if st.button(f"❌ 拒绝", key=f"reject_team_req_{request['id']}"):
                             with st.spinner("处理中..."):
                                 if update_team_change_request(request['id'], "rejected"):
-                                    st.success("已拒绝队伍变更请求")
-                                    time.sleep(1)
+                                    st.toast("已拒绝队伍变更请求", icon="✅")
                                     st.rerun()
                                 else:
                                     st.error("拒绝失败")